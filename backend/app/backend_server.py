@@ -1,4 +1,5 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
 import requests
@@ -8,22 +9,80 @@ import dotenv
 import asyncio
 import threading
 import time
+import itertools
+import functools
+import hashlib
+import re
+import bisect
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the embedding model to a few CPU threads; using every core contends
+# with the request threads and with other gunicorn workers. The OpenMP/MKL
+# variables only take effect if they are set before numpy and torch are imported.
+TORCH_NUM_THREADS = int(os.environ.get(
+    "TORCH_NUM_THREADS",
+    max(1, min(4, (os.cpu_count() or 1) // int(os.environ.get("GUNICORN_WORKERS", 1))))
+))
+os.environ.setdefault("OMP_NUM_THREADS", str(TORCH_NUM_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(TORCH_NUM_THREADS))
 
 # AI Assistant imports
 try:
     from sentence_transformers import SentenceTransformer
+    # Shared with new2.py and ques.py; the package path applies under gunicorn
+    try:
+        from app.embedding_model import load_onnx_model, ensure_fast_tokenizer
+    except ImportError:
+        from embedding_model import load_onnx_model, ensure_fast_tokenizer
     from pinecone import Pinecone, ServerlessSpec
     import google.generativeai as genai
+    from google.generativeai import client as genai_client
     from firecrawl import AsyncFirecrawlApp, ScrapeOptions
+    import torch
+    import numpy as np
+    torch.set_num_threads(TORCH_NUM_THREADS)
+    torch.set_num_interop_threads(1)
     AI_IMPORTS_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️ AI imports not available: {e}")
     AI_IMPORTS_AVAILABLE = False
 
+# gRPC data plane for Pinecone (pinecone[grpc]); falls back to REST when missing
+try:
+    from pinecone.grpc import PineconeGRPC, GRPCClientConfig
+    PINECONE_GRPC_AVAILABLE = True
+except ImportError:
+    PINECONE_GRPC_AVAILABLE = False
+
+# Local mirror of indexed vectors (faiss-cpu); searched before Pinecone when present
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# Faster JSON encoding for responses; Flask's stdlib json is used when missing
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Load environment variables
 dotenv.load_dotenv()
 
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+if ORJSON_AVAILABLE:
+    app.json = ORJSONProvider(app)
 CORS(app, origins=[
     "https://rag-chatbot-nextjs-1.onrender.com",
     "https://rag-chatbot-nextjs.onrender.com", 
@@ -52,7 +111,54 @@ INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "airport-index")
 # Changed to smaller model that works better with free tier
 # MODEL_NAME = 'all-MiniLM-L6-v2'  # Correct smaller model (23MB)
 MODEL_NAME = 'BAAI/bge-small-en-v1.5'  # Comment out this line
+# Run the embedding model on ONNX Runtime with int8 weights where possible;
+# set EMBED_BACKEND=torch to use the plain PyTorch model instead
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "onnx")
+# Chunks are collected into batches of EMBED_BATCH_SIZE per encode call. The
+# model sorts each batch by length and runs it in mini-batches of
+# ENCODE_BATCH_SIZE, so texts of similar length are padded together.
+EMBED_BATCH_SIZE = 1024 if AI_IMPORTS_AVAILABLE and torch.cuda.is_available() else 256
+ENCODE_BATCH_SIZE = 128 if AI_IMPORTS_AVAILABLE and torch.cuda.is_available() else 32
+# Vectors are upserted in parallel batches of 100 over a shared thread pool
+UPSERT_BATCH_SIZE = 100
+UPSERT_POOL_THREADS = 30
+# Pinecone rejects upsert requests over 2MB, keep some headroom
+UPSERT_MAX_BYTES = int(1.8 * 1024 * 1024)
+# Upper bound on the JSON size of one float in a vector, including separator
+FLOAT_JSON_BYTES = 25
+# Maximum number of Firecrawl crawls running at the same time
+FIRECRAWL_CONCURRENCY = int(os.getenv("FIRECRAWL_CONCURRENCY", 20))
+# Pipeline tuning: the embedder waits up to EMBED_MAX_WAIT seconds to fill a
+# batch, and UPSERT_WORKERS batches are written to Pinecone at the same time
+EMBED_MAX_WAIT = 0.2
+UPSERT_WORKERS = 4
+# Full document text is kept on local disk; Pinecone only stores a snippet
+CONTENT_STORE_DIR = os.getenv("CONTENT_STORE_DIR", "content_store")
+# Vectors indexed by this server are mirrored locally and persisted here
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+EMBEDDING_DIM = 384
+# Long pages are split into overlapping chunks that fit the model's 512 tokens,
+# measured with the model's own tokenizer (characters if it has no offsets)
+CHUNK_TOKENS = 400
+CHUNK_OVERLAP_TOKENS = 50
+CHUNK_SIZE = 1600
+CHUNK_OVERLAP = 200
+# Context sent to Gemini with each question, in embedding-model tokens
+# (characters when the tokenizer has no offsets)
+MAX_CONTEXT_TOKENS = 1200
+MAX_CONTEXT_CHARS = 4000
 
+# Instructions sent ahead of every prompt; only the question and context vary
+SYSTEM_PROMPT_RAG = """You are a helpful AI assistant with access to a vector database. 
+Use the provided context to answer questions accurately.
+
+Guidelines:
+- Be helpful, accurate, and concise
+- Only use information from the provided context
+- If the context doesn't contain enough information, say so
+- Include specific details when available
+- Be friendly and professional"""
+SYSTEM_PROMPT_CHAT = "You are a helpful AI assistant. Answer questions to the best of your ability."
 
 # Get port from environment (Render sets this)
 PORT = int(os.environ.get('PORT', 5000))
@@ -62,9 +168,10 @@ print(f"📡 Gemini API Key: {'✓ Loaded' if GEMINI_API_KEY else '✗ Missing'}
 print(f"📡 Pinecone API Key: {'✓ Loaded' if PINECONE_API_KEY else '✗ Missing'}")
 print(f"📡 Firecrawl API Key: {'✓ Loaded' if FIRECRAWL_API_KEY else '✗ Missing'}")
 print(f"🤖 AI Imports: {'✓ Available' if AI_IMPORTS_AVAILABLE else '✗ Missing'}")
-print(f"🧠 Model: {MODEL_NAME} (lightweight for free tier)")
+print(f"🧠 Model: {MODEL_NAME} (lightweight for free tier, {EMBED_BACKEND} backend)")
+print(f"🧵 Torch threads: {TORCH_NUM_THREADS} (set TORCH_NUM_THREADS to change)")
 
-# AI Assistant components (loaded lazily)
+# AI Assistant components (loaded in the background at startup, see below)
 ai_components = {
     "model": None,
     "pinecone": None,
@@ -72,190 +179,848 @@ ai_components = {
     "gemini_model": None,
     "loaded": False
 }
+ai_components_lock = threading.Lock()
 
-# Store API keys and URLs received from frontend
-stored_data = {
-    "api_keys": {},
-    "urls": [],
-    "crawled_data": [],
-    "demo_mode": False,
-    "vectorization_status": {
+# Local FAISS mirror of the vectors this server has indexed, so most chat
+# queries are answered without a Pinecone round trip
+local_index = {
+    "faiss": None,
+    "ids": [],        # FAISS label -> vector id
+    "labels": {},     # vector id -> FAISS label
+    "metadata": {}    # vector id -> metadata
+}
+local_index_lock = threading.Lock()
+
+# Gemini models shared by RAG answers and general chat, one per API key.
+# genai.configure is process-wide, so each model gets its own client bound to
+# its key when it is created.
+gemini_models = {}
+gemini_models_lock = threading.Lock()
+
+# Firecrawl client, likewise kept for as long as the API key stays the same
+firecrawl_client = {
+    "api_key": None,
+    "app": None
+}
+firecrawl_client_lock = threading.Lock()
+
+# Answers to recent questions, keyed by the normalized question. The version
+# is part of the key and is bumped after each vectorization run, so answers
+# built from an older index are never served.
+MAX_CACHED_ANSWERS = 512
+# Paraphrased questions reuse a cached answer when their embeddings are this close.
+# BGE scores for short questions cluster high ("Terminal 2" vs "Terminal 3" can
+# pass 0.95), so keep this strict; exact repeats already hit the keyed cache.
+# Set above 1 to turn semantic matching off.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.98))
+answer_cache = {
+    "version": 0,
+    "entries": OrderedDict(),
+    # Question embeddings of the cached answers, one row per slot
+    "embeddings": None,
+    "slot_keys": [None] * MAX_CACHED_ANSWERS,
+    "slots": {}
+}
+answer_cache_lock = threading.Lock()
+
+# Cap stored errors and crawl results so a long-lived server doesn't grow without bound
+MAX_STATUS_ERRORS = 500
+MAX_CRAWLED_DATA = 1000
+
+def answer_cache_key(question):
+    normalized = " ".join(question.lower().split())
+    with answer_cache_lock:
+        version = answer_cache["version"]
+    return f"{version}:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()}"
+
+def get_cached_answer(key):
+    """Return a copy of the cached result for key, or None"""
+    with answer_cache_lock:
+        result = answer_cache["entries"].get(key)
+        if result is None:
+            return None
+        answer_cache["entries"].move_to_end(key)
+        return dict(result)
+
+def find_similar_answer(query_embedding):
+    """Return a copy of the cached result for the closest earlier question, or None"""
+    with answer_cache_lock:
+        if not answer_cache["slots"]:
+            return None
+        # Embeddings are normalized, so the dot product is cosine similarity.
+        # Empty slots are zero rows and never reach the threshold.
+        similarities = answer_cache["embeddings"] @ np.asarray(query_embedding, dtype=np.float32)
+        slot = int(similarities.argmax())
+        if similarities[slot] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        key = answer_cache["slot_keys"][slot]
+        answer_cache["entries"].move_to_end(key)
+        return dict(answer_cache["entries"][key])
+
+def cache_answer(key, result, query_embedding=None):
+    with answer_cache_lock:
+        if not key.startswith(f"{answer_cache['version']}:"):
+            return  # The index changed while this answer was generated
+        answer_cache["entries"][key] = result
+        answer_cache["entries"].move_to_end(key)
+        while len(answer_cache["entries"]) > MAX_CACHED_ANSWERS:
+            evicted, _ = answer_cache["entries"].popitem(last=False)
+            slot = answer_cache["slots"].pop(evicted, None)
+            if slot is not None:
+                answer_cache["slot_keys"][slot] = None
+                answer_cache["embeddings"][slot] = 0
+
+        if query_embedding is None or key in answer_cache["slots"]:
+            return
+        if answer_cache["embeddings"] is None:
+            answer_cache["embeddings"] = np.zeros((MAX_CACHED_ANSWERS, len(query_embedding)), dtype=np.float32)
+        slot = answer_cache["slot_keys"].index(None)
+        answer_cache["slot_keys"][slot] = key
+        answer_cache["slots"][key] = slot
+        answer_cache["embeddings"][slot] = query_embedding
+
+def invalidate_answer_cache():
+    with answer_cache_lock:
+        answer_cache["version"] += 1
+        answer_cache["entries"].clear()
+        answer_cache["slots"].clear()
+        answer_cache["slot_keys"] = [None] * MAX_CACHED_ANSWERS
+        if answer_cache["embeddings"] is not None:
+            answer_cache["embeddings"][:] = 0
+
+def new_vectorization_status(**fields):
+    """Create a fresh vectorization status with a bounded error log"""
+    status = {
         "in_progress": False,
         "completed": False,
         "total_urls": 0,
         "processed_urls": 0,
         "successful_docs": 0,
-        "errors": []
+        "errors": deque(maxlen=MAX_STATUS_ERRORS)
     }
+    status.update(fields)
+    return status
+
+# Store API keys and URLs received from frontend
+stored_data = {
+    "api_keys": {},
+    "urls": [],
+    "deep": True,  # crawl from each URL; False scrapes just the listed pages
+    "crawled_data": deque(maxlen=MAX_CRAWLED_DATA),
+    "demo_mode": False,
+    "vectorization_status": new_vectorization_status()
 }
+# Guards vectorization_status, which the background thread updates while requests read it
+status_lock = threading.Lock()
+
+def update_status(**fields):
+    """Set vectorization status fields"""
+    with status_lock:
+        stored_data["vectorization_status"].update(fields)
+
+def add_status_error(error_msg):
+    """Record an error in the vectorization status"""
+    with status_lock:
+        stored_data["vectorization_status"]["errors"].append(error_msg)
+
+def status_snapshot():
+    """Return a JSON-serializable copy of the vectorization status"""
+    with status_lock:
+        snapshot = dict(stored_data["vectorization_status"])
+        snapshot["errors"] = list(snapshot["errors"])
+    return snapshot
+
+def embedding_device():
+    """Pick the fastest device PyTorch can run the embedding model on"""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def load_embedding_model():
+    """Load the sentence transformer, preferring the quantized ONNX Runtime backend on CPU"""
+    device = embedding_device()
+    if EMBED_BACKEND == "onnx" and device == "cpu":
+        try:
+            import onnxruntime as ort
+            # ONNX Runtime sizes its own thread pool; keep it to the same budget as torch
+            session_options = ort.SessionOptions()
+            session_options.intra_op_num_threads = TORCH_NUM_THREADS
+            session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            model = load_onnx_model(
+                MODEL_NAME,
+                provider="CPUExecutionProvider",
+                session_options=session_options
+            )
+            if model is not None:
+                return model
+        except ImportError as e:
+            print(f"⚠️ ONNX Runtime not available: {e}")
+
+    model = SentenceTransformer(MODEL_NAME, device=device)
+    if device == "cuda":
+        # fp16 roughly doubles GPU throughput; retrieval quality is unaffected
+        model.half()
+    print(f"✅ Sentence transformer model loaded (PyTorch, {device})")
+    return model
 
 def load_ai_components():
     """Load AI components for demo mode"""
     global ai_components
     
     if not AI_IMPORTS_AVAILABLE:
-        raise Exception("AI libraries not installed. Please install: pip install sentence-transformers pinecone-client google-generativeai firecrawl-py")
+        raise Exception("AI libraries not installed. Please install: pip install sentence-transformers pinecone[grpc] google-generativeai firecrawl-py")
     
     if ai_components["loaded"]:
         return ai_components
     
-    print("🔄 Loading AI components...")
-    
-    try:
-        # Load smaller sentence transformer model (better for free tier)
-        ai_components["model"] = SentenceTransformer(MODEL_NAME)
-        print("✅ Sentence transformer model loaded (lightweight)")
-        
-        # Initialize Pinecone
-        ai_components["pinecone"] = Pinecone(api_key=PINECONE_API_KEY)
-        
-        # Create index if not exists (updated dimension for smaller model)
-        existing_indexes = [index.name for index in ai_components["pinecone"].list_indexes()]
-        if INDEX_NAME not in existing_indexes:
-            print(f"🔄 Creating Pinecone index: {INDEX_NAME}")
-            ai_components["pinecone"].create_index(
-                name=INDEX_NAME,
-                dimension=384,  # all-MiniLM-L6-v2 uses 384 dimensions
-                metric="cosine",
-                spec=ServerlessSpec(cloud="aws", region="us-east-1")
-            )
-            print("⏳ Waiting for index to be ready...")
-            time.sleep(10)
-            print("✅ Index created!")
-        else:
-            print(f"✅ Index {INDEX_NAME} already exists!")
-        
-        ai_components["index"] = ai_components["pinecone"].Index(INDEX_NAME)
-        print("✅ Pinecone connection established")
-        
-        # Initialize Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        ai_components["gemini_model"] = genai.GenerativeModel('gemini-1.5-flash')
-        print("✅ Gemini client initialized")
-        
-        ai_components["loaded"] = True
-        print("🎉 All AI components loaded successfully!")
-        
-        return ai_components
+    with ai_components_lock:
+        # Another thread may have finished loading while we waited for the lock
+        if ai_components["loaded"]:
+            return ai_components
+            
+        print("🔄 Loading AI components...")
         
+        try:
+            # Load smaller sentence transformer model (better for free tier)
+            ai_components["model"] = load_embedding_model()
+            ensure_fast_tokenizer(ai_components["model"], MODEL_NAME)
+            
+            # Initialize Pinecone
+            # The gRPC client only changes upsert/query/fetch; index management stays on REST
+            if PINECONE_GRPC_AVAILABLE:
+                ai_components["pinecone"] = PineconeGRPC(api_key=PINECONE_API_KEY)
+            else:
+                ai_components["pinecone"] = Pinecone(api_key=PINECONE_API_KEY)
+            
+            # Create index if not exists (updated dimension for smaller model)
+            existing_indexes = [index.name for index in ai_components["pinecone"].list_indexes()]
+            if INDEX_NAME not in existing_indexes:
+                print(f"🔄 Creating Pinecone index: {INDEX_NAME}")
+                ai_components["pinecone"].create_index(
+                    name=INDEX_NAME,
+                    dimension=384,  # all-MiniLM-L6-v2 uses 384 dimensions
+                    metric="cosine",
+                    spec=ServerlessSpec(cloud="aws", region="us-east-1")
+                )
+                print("⏳ Waiting for index to be ready...")
+                delay = 0.2
+                for _ in range(60):
+                    if ai_components["pinecone"].describe_index(INDEX_NAME).status['ready']:
+                        break
+                    time.sleep(delay)
+                    delay = min(delay * 1.5, 2.0)
+                else:
+                    raise TimeoutError(f"Pinecone index {INDEX_NAME} never became ready")
+                print("✅ Index created!")
+            else:
+                print(f"✅ Index {INDEX_NAME} already exists!")
+            
+            if PINECONE_GRPC_AVAILABLE:
+                ai_components["index"] = ai_components["pinecone"].Index(
+                    INDEX_NAME,
+                    grpc_config=GRPCClientConfig(timeout=30)
+                )
+            else:
+                ai_components["index"] = ai_components["pinecone"].Index(INDEX_NAME, pool_threads=UPSERT_POOL_THREADS)
+            print(f"✅ Pinecone connection established ({'gRPC' if PINECONE_GRPC_AVAILABLE else 'REST'})")
+            
+            # Initialize Gemini
+            ai_components["gemini_model"] = get_gemini_model(GEMINI_API_KEY)
+            print("✅ Gemini client initialized")
+            
+            load_local_index()
+            
+            ai_components["loaded"] = True
+            print("🎉 All AI components loaded successfully!")
+            
+            return ai_components
+            
+        except Exception as e:
+            print(f"❌ Error loading AI components: {str(e)}")
+            raise e
+
+def chunks(iterable, batch_size=100):
+    """Yield successive tuples of batch_size items from an iterable"""
+    it = iter(iterable)
+    chunk = tuple(itertools.islice(it, batch_size))
+    while chunk:
+        yield chunk
+        chunk = tuple(itertools.islice(it, batch_size))
+
+def estimate_payload_size(vector):
+    """Estimate a vector's serialized size without JSON-encoding its values"""
+    return len(vector["id"]) + len(vector["values"]) * FLOAT_JSON_BYTES + len(json.dumps(vector["metadata"])) + 64
+
+def split_by_payload_size(vectors, max_bytes=UPSERT_MAX_BYTES):
+    """Split vectors further so that no upsert request exceeds max_bytes"""
+    batch = []
+    batch_bytes = 0
+    for vector in vectors:
+        size = estimate_payload_size(vector)
+        if batch and batch_bytes + size > max_bytes:
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(vector)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+def upsert_vectors(index, vectors):
+    """
+    Upsert vectors to Pinecone in parallel batches.
+    Returns the ids of the vectors written and a list of error messages.
+    """
+    async_results = [
+        (batch, index.upsert(vectors=batch, async_req=True))
+        for chunk in chunks(vectors, UPSERT_BATCH_SIZE)
+        for batch in split_by_payload_size(list(chunk))
+    ]
+
+    upserted_ids = []
+    errors = []
+    for batch, async_result in async_results:
+        try:
+            # gRPC upserts return futures, REST upserts return thread pool results
+            if hasattr(async_result, "result"):
+                async_result.result()
+            else:
+                async_result.get()
+            upserted_ids.extend(vector["id"] for vector in batch)
+        except Exception as e:
+            errors.append(f"Error upserting batch of {len(batch)} vectors: {str(e)}")
+    return upserted_ids, errors
+
+# Marks the end of the crawl -> embed -> upsert pipeline
+PIPELINE_DONE = object()
+
+# Embedding batches run on their own thread so CPU-bound encoding never waits
+# behind (or starves) the Pinecone fetch/upsert calls in the default executor
+embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+def fetch_existing_vectors(index, ids):
+    """Return the vectors among ids that are already stored in the index, keyed by id"""
+    existing = {}
+    for batch in chunks(ids, UPSERT_BATCH_SIZE):
+        response = index.fetch(ids=list(batch))
+        for vector_id, vector in response.vectors.items():
+            existing[vector_id] = {
+                "id": vector_id,
+                "values": list(vector.values),
+                "metadata": vector.metadata or {}
+            }
+    return existing
+
+def split_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Split text into overlapping chunks of at most chunk_size characters,
+    breaking on paragraph, line, sentence or word boundaries where possible
+    """
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Cut at the last boundary in the second half of the window
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(separator, start + chunk_size // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+
+        piece = text[start:end].strip()
+        if piece:
+            pieces.append(piece)
+        if end >= len(text):
+            break
+        start = max(end - chunk_overlap, start + 1)
+    return pieces
+
+def split_text_by_tokens(text, tokenizer, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Split text into overlapping chunks of at most chunk_tokens model tokens,
+    breaking on paragraph, line, sentence or word boundaries where possible
+    """
+    # Tokenize once; the character offsets map token windows back onto the text
+    offsets = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        verbose=False
+    )["offset_mapping"]
+    token_starts = [start for start, _ in offsets]
+
+    pieces = []
+    first = 0
+    while first < len(offsets):
+        last = min(first + chunk_tokens, len(offsets))
+        start_char = offsets[first][0]
+        end_char = offsets[last - 1][1]
+        if last < len(offsets):
+            # Cut at the last boundary in the second half of the window
+            half_char = offsets[(first + last) // 2][0]
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(separator, half_char, end_char)
+                if cut != -1:
+                    end_char = cut + len(separator)
+                    last = bisect.bisect_left(token_starts, end_char)
+                    break
+
+        piece = text[start_char:end_char].strip()
+        if piece:
+            pieces.append(piece)
+        if last >= len(offsets):
+            break
+        first = max(last - overlap_tokens, first + 1)
+    return pieces
+
+def split_document(content, tokenizer):
+    """
+    Return (chunk id suffix, chunk text) pairs for a document. Token-window
+    chunks get their own id suffix so they never share ids with chunks cut
+    by the character splitter.
+    """
+    if getattr(tokenizer, "is_fast", False):
+        return [(f"t{chunk_i:04d}", chunk) for chunk_i, chunk in enumerate(split_text_by_tokens(content, tokenizer))]
+    return [(f"{chunk_i:04d}", chunk) for chunk_i, chunk in enumerate(split_text(content))]
+
+def trim_context(pieces, tokenizer, max_tokens=MAX_CONTEXT_TOKENS):
+    """
+    Join context pieces in ranking order until the token budget runs out,
+    cutting the last piece at a token boundary
+    """
+    # Overlapping chunks of one page can come back as identical text
+    pieces = [piece for piece in dict.fromkeys(pieces) if piece]
+    if not getattr(tokenizer, "is_fast", False):
+        combined = '\n\n---\n\n'.join(pieces)
+        if len(combined) > MAX_CONTEXT_CHARS:
+            combined = combined[:MAX_CONTEXT_CHARS] + "..."
+        return combined
+
+    kept = []
+    remaining = max_tokens
+    for piece in pieces:
+        offsets = tokenizer(
+            piece,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False
+        )["offset_mapping"]
+        if len(offsets) <= remaining:
+            kept.append(piece)
+            remaining -= len(offsets)
+            continue
+        if remaining > 0:
+            kept.append(piece[:offsets[remaining - 1][1]] + "...")
+        break
+    return '\n\n---\n\n'.join(kept)
+
+def save_content(doc_id, content):
+    """Write a document's full text to the content store"""
+    os.makedirs(CONTENT_STORE_DIR, exist_ok=True)
+    with open(os.path.join(CONTENT_STORE_DIR, f"{doc_id}.md"), "w", encoding="utf-8") as f:
+        f.write(content)
+
+def load_content(doc_id, metadata):
+    """Read a document's full text, falling back to the text stored in Pinecone"""
+    # Content is stored under the vector id; older vectors name it in content_ref
+    content_ref = metadata.get('content_ref', doc_id)
+    try:
+        with open(os.path.join(CONTENT_STORE_DIR, f"{content_ref}.md"), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        pass
+    # Vectors indexed before the content store existed carry full_content
+    return metadata.get('full_content') or metadata.get('snippet') or metadata.get('content', '')
+
+def local_index_path(file_name):
+    return os.path.join(LOCAL_INDEX_DIR, f"{INDEX_NAME}.{file_name}")
+
+def add_to_local_index(vectors):
+    """Mirror vectors in the local index; re-added ids replace their old vector"""
+    if not FAISS_AVAILABLE or not vectors:
+        return
+    vectors = list({vector["id"]: vector for vector in vectors}.values())
+    with local_index_lock:
+        if local_index["faiss"] is None:
+            # Embeddings are normalized, so inner product is cosine similarity
+            local_index["faiss"] = faiss.IndexIDMap2(faiss.IndexFlatIP(EMBEDDING_DIM))
+
+        labels = []
+        for vector in vectors:
+            label = local_index["labels"].get(vector["id"])
+            if label is None:
+                label = len(local_index["ids"])
+                local_index["ids"].append(vector["id"])
+                local_index["labels"][vector["id"]] = label
+            local_index["metadata"][vector["id"]] = vector["metadata"]
+            labels.append(label)
+
+        labels = np.asarray(labels, dtype=np.int64)
+        local_index["faiss"].remove_ids(labels)
+        local_index["faiss"].add_with_ids(
+            np.asarray([vector["values"] for vector in vectors], dtype=np.float32),
+            labels
+        )
+
+def query_local_index(query_embedding, top_k):
+    """Search the local index, returning Pinecone-style matches with metadata"""
+    if not FAISS_AVAILABLE:
+        return []
+    with local_index_lock:
+        if local_index["faiss"] is None or local_index["faiss"].ntotal == 0:
+            return []
+        scores, labels = local_index["faiss"].search(
+            np.asarray([query_embedding], dtype=np.float32),
+            top_k
+        )
+        matches = []
+        for score, label in zip(scores[0], labels[0]):
+            if label == -1:
+                continue
+            vector_id = local_index["ids"][label]
+            matches.append({
+                "id": vector_id,
+                "score": float(score),
+                "metadata": local_index["metadata"][vector_id]
+            })
+        return matches
+
+def get_local_vectors(ids):
+    """Return the stored values of the ids present in the local index"""
+    if not FAISS_AVAILABLE:
+        return {}
+    with local_index_lock:
+        if local_index["faiss"] is None:
+            return {}
+        return {
+            vector_id: local_index["faiss"].reconstruct(local_index["labels"][vector_id]).tolist()
+            for vector_id in ids
+            if vector_id in local_index["labels"]
+        }
+
+def save_local_index():
+    """Persist the local index so restarts don't have to rebuild it"""
+    if not FAISS_AVAILABLE:
+        return
+    with local_index_lock:
+        if local_index["faiss"] is None:
+            return
+        os.makedirs(LOCAL_INDEX_DIR, exist_ok=True)
+        faiss.write_index(local_index["faiss"], local_index_path("faiss"))
+        with open(local_index_path("json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": local_index["ids"], "metadata": local_index["metadata"]}, f)
+
+def load_local_index():
+    """Load the persisted local index, if there is one"""
+    if not FAISS_AVAILABLE or not os.path.exists(local_index_path("faiss")):
+        return
+    try:
+        with open(local_index_path("json"), encoding="utf-8") as f:
+            saved = json.load(f)
+        with local_index_lock:
+            local_index["faiss"] = faiss.read_index(local_index_path("faiss"))
+            local_index["ids"] = saved["ids"]
+            local_index["labels"] = {vector_id: label for label, vector_id in enumerate(saved["ids"])}
+            local_index["metadata"] = saved["metadata"]
+        print(f"✅ Local vector index loaded ({local_index['faiss'].ntotal} vectors)")
     except Exception as e:
-        print(f"❌ Error loading AI components: {str(e)}")
-        raise e
+        print(f"⚠️ Could not load local vector index: {e}")
+
+def content_key(content):
+    """Hash whitespace- and case-normalized content so duplicate pages share a key"""
+    normalized = re.sub(r'\s+', ' ', content).strip().lower()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
 
-async def process_urls_to_pinecone(url_list: list[str], firecrawl_key: str):
+def parse_documents(result):
+    """Pull the list of documents out of a Firecrawl crawl result"""
+    if hasattr(result, 'data') and result.data:
+        return result.data
+    elif isinstance(result, dict):
+        return result.get("data", result.get("documents", []))
+    return []
+
+def extract_document(doc, doc_i):
+    """Return the (url, content) pair of a crawled document"""
+    if hasattr(doc, 'metadata'):
+        url = doc.metadata.get('sourceURL', f'doc_{doc_i}')
+        content = getattr(doc, 'markdown', '') or getattr(doc, 'content', '')
+    elif isinstance(doc, dict):
+        url = doc.get("metadata", {}).get("sourceURL") or doc.get("url", f"doc_{doc_i}")
+        content = doc.get("markdown", "") or doc.get("content", "")
+    else:
+        url = f"doc_{doc_i}"
+        content = str(doc)
+    return url, content.strip()
+
+async def get_batch(queue, max_items, max_wait):
+    """
+    Wait for one item from the queue, then keep collecting until max_items
+    are gathered, max_wait seconds pass or the end-of-pipeline marker arrives
+    """
+    loop = asyncio.get_running_loop()
+    items = [await queue.get()]
+    deadline = loop.time() + max_wait
+    while len(items) < max_items and items[-1] is not PIPELINE_DONE:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            items.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return items
+
+async def process_urls_to_pinecone(url_list: list[str], firecrawl_key: str, deep: bool = True):
     """
     Process URLs to Pinecone vector database - adapted from new2.py
+
+    Runs as a three stage pipeline so network and model work overlap:
+    crawlers push chunks onto embed_queue, the embedder encodes them in
+    batches and pushes vectors onto upsert_queue, and upserters write them
+    to Pinecone.
+
+    With deep=True every URL is a seed for its own crawl job; otherwise the
+    URLs are treated as leaf pages and scraped together in one batch job.
     """
     try:
         components = load_ai_components()
         model = components["model"]
+        tokenizer = getattr(model, "tokenizer", None)
         index = components["index"]
         
-        app = AsyncFirecrawlApp(api_key=firecrawl_key)
-        successful_uploads = 0
+        app = get_firecrawl_app(firecrawl_key)
+        loop = asyncio.get_running_loop()
         
-        stored_data["vectorization_status"]["in_progress"] = True
-        stored_data["vectorization_status"]["total_urls"] = len(url_list)
-        stored_data["vectorization_status"]["processed_urls"] = 0
-        stored_data["vectorization_status"]["successful_docs"] = 0
-        stored_data["vectorization_status"]["errors"] = []
+        with status_lock:
+            stored_data["vectorization_status"] = new_vectorization_status(
+                in_progress=True,
+                total_urls=len(url_list)
+            )
+
+        # Bounded queues make crawlers wait when embedding falls behind
+        embed_queue = asyncio.Queue(maxsize=EMBED_BATCH_SIZE * 4)
+        upsert_queue = asyncio.Queue(maxsize=UPSERT_WORKERS * 2)
+        semaphore = asyncio.Semaphore(FIRECRAWL_CONCURRENCY)
+        # Content hashes seen during this run, across all base URLs
+        seen_content = set()
+        # Documents with at least one chunk in the index
+        indexed_docs = set()
+
+        def record_error(error_msg):
+            print(f"❌ {error_msg}")
+            add_status_error(error_msg)
+
+        def mark_indexed(doc_ids):
+            indexed_docs.update(doc_ids)
+            update_status(successful_docs=len(indexed_docs))
+
+        async def index_documents(documents, base_url=None):
+            """Chunk documents and queue the chunks that are not indexed yet"""
+            # Split each document into chunks small enough to embed whole.
+            # Ids are derived from the content, so they are stable across runs.
+            doc_chunks = []
+            for doc_i, doc in enumerate(documents):
+                try:
+                    url, content = extract_document(doc, doc_i)
+                    if not content or len(content) < 50:
+                        print(f"⚠️ Skipping short content from: {url}")
+                        continue
 
-        for i, base_url in enumerate(url_list):
-            print(f"\n🕷️ Crawling: {base_url}")
+                    # The same page often comes back under several URLs
+                    doc_id = f"doc_{content_key(content)}"
+                    if doc_id in seen_content:
+                        print(f"⚠️ Skipping duplicate content from: {url}")
+                        continue
+                    seen_content.add(doc_id)
+
+                    for chunk_i, (suffix, chunk) in enumerate(split_document(content, tokenizer)):
+                        chunk_id = f"{doc_id}_{suffix}"
+                        save_content(chunk_id, chunk)
+                        doc_chunks.append((chunk_id, doc_id, chunk_i, url, base_url or url, chunk))
+
+                except Exception as e:
+                    record_error(f"Error processing document {doc_i} from {base_url or 'batch scrape'}: {str(e)}")
+
+            # Chunks already in the index from an earlier crawl are not re-embedded
             try:
-                result = await app.crawl_url(
-                    url=base_url,
-                    limit=5,
-                    max_depth=5,
-                    allow_backward_links=True,
-                    scrape_options=ScrapeOptions(
-                        formats=["markdown"],
-                        only_main_content=True,
-                        parse_pdf=True,
-                        max_age=14400000
-                    )
+                existing_ids = await loop.run_in_executor(
+                    None, fetch_existing_vectors, index, [c[0] for c in doc_chunks]
                 )
+            except Exception as e:
+                print(f"⚠️ Could not check for existing vectors, indexing everything: {e}")
+                existing_ids = {}
+            if existing_ids:
+                print(f"⏭️ Skipping {len(existing_ids)} chunks already indexed from {base_url or 'batch scrape'}")
+                add_to_local_index(list(existing_ids.values()))
+                mark_indexed({c[1] for c in doc_chunks if c[0] in existing_ids})
 
-                # Parse documents
-                if hasattr(result, 'data') and result.data:
-                    documents = result.data
-                elif isinstance(result, dict):
-                    documents = result.get("data", result.get("documents", []))
-                else:
-                    documents = []
+            for doc_chunk in doc_chunks:
+                if doc_chunk[0] not in existing_ids:
+                    await embed_queue.put(doc_chunk)
 
+        async def crawler(base_url):
+            try:
+                async with semaphore:
+                    print(f"\n🕷️ Crawling: {base_url}")
+                    result = await app.crawl_url(
+                        url=base_url,
+                        limit=5,
+                        max_depth=5,
+                        allow_backward_links=True,
+                        scrape_options=ScrapeOptions(
+                            formats=["markdown"],
+                            only_main_content=True,
+                            parse_pdf=True,
+                            max_age=14400000
+                        )
+                    )
+
+                documents = parse_documents(result)
                 print(f"✅ Scraped {len(documents)} documents from {base_url}")
+                await index_documents(documents, base_url)
+
+            except Exception as e:
+                record_error(f"Error crawling {base_url}: {str(e)}")
+
+            finally:
+                with status_lock:
+                    stored_data["vectorization_status"]["processed_urls"] += 1
+
+        async def scraper(leaf_urls):
+            # One batch job for all leaf pages instead of a crawl job per URL;
+            # the client polls the job status until every page is scraped
+            try:
+                print(f"\n🕷️ Batch scraping {len(leaf_urls)} URLs")
+                # batch_scrape_urls rejects parse_pdf/max_age, which only crawl_url's
+                # ScrapeOptions accept; PDFs are still parsed by default
+                result = await app.batch_scrape_urls(
+                    leaf_urls,
+                    formats=["markdown"],
+                    only_main_content=True
+                )
+
+                documents = parse_documents(result)
+                print(f"✅ Scraped {len(documents)} documents from {len(leaf_urls)} URLs")
+                await index_documents(documents)
+
+            except Exception as e:
+                record_error(f"Error batch scraping {len(leaf_urls)} URLs: {str(e)}")
+
+            finally:
+                with status_lock:
+                    stored_data["vectorization_status"]["processed_urls"] += len(leaf_urls)
+
+        def encode_chunks(texts):
+            return model.encode(
+                texts,
+                batch_size=ENCODE_BATCH_SIZE,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+
+        async def embedder():
+            while True:
+                batch = await get_batch(embed_queue, EMBED_BATCH_SIZE, EMBED_MAX_WAIT)
+                done = batch[-1] is PIPELINE_DONE
+                doc_chunks = [c for c in batch if c is not PIPELINE_DONE]
 
-                for doc_i, doc in enumerate(documents):
+                if doc_chunks:
                     try:
-                        if hasattr(doc, 'metadata'):
-                            url = doc.metadata.get('sourceURL', f'doc_{doc_i}')
-                            content = getattr(doc, 'markdown', '') or getattr(doc, 'content', '')
-                        elif isinstance(doc, dict):
-                            url = doc.get("metadata", {}).get("sourceURL") or doc.get("url", f"doc_{doc_i}")
-                            content = doc.get("markdown", "") or doc.get("content", "")
-                        else:
-                            url = f"doc_{doc_i}"
-                            content = str(doc)
-
-                        content = content.strip()
-                        if not content or len(content) < 50:
-                            print(f"⚠️ Skipping short content from: {url}")
-                            continue
-
-                        print(f"🧠 Generating embedding for: {url}")
-                        embedding = model.encode(content, normalize_embeddings=True).tolist()
-
-                        doc_id = f"doc_{hash(url) % 100000}_{doc_i}"
-
-                        index.upsert([{
-                            "id": doc_id,
-                            "values": embedding,
-                            "metadata": {
-                                "url": url,
-                                "content": content[:500],
-                                "full_content": content
+                        # Ids are content hashes, so a chunk already in the local
+                        # mirror (e.g. after the Pinecone index was recreated)
+                        # keeps its vector instead of being encoded again
+                        values_by_id = get_local_vectors([c[0] for c in doc_chunks])
+                        to_encode = [c for c in doc_chunks if c[0] not in values_by_id]
+                        if values_by_id:
+                            print(f"♻️ Reusing {len(values_by_id)} embeddings from the local index")
+                        if to_encode:
+                            print(f"🧠 Generating embeddings for {len(to_encode)} chunks")
+                            # Encoding is CPU bound, keep it off the event loop
+                            embeddings = await loop.run_in_executor(
+                                embed_executor, encode_chunks, [c[-1] for c in to_encode]
+                            )
+                            # One tolist() call converts the whole batch at C speed
+                            values_by_id.update(zip((c[0] for c in to_encode), embeddings.tolist()))
+                        vectors = [
+                            {
+                                "id": chunk_id,
+                                "values": values_by_id[chunk_id],
+                                "metadata": {
+                                    "url": url,
+                                    "parent_url": base_url,
+                                    "chunk_i": chunk_i,
+                                    "snippet": chunk[:500]
+                                }
                             }
-                        }])
+                            for chunk_id, _, chunk_i, url, base_url, chunk in doc_chunks
+                        ]
+                        parents = {c[0]: c[1] for c in doc_chunks}
+                        await upsert_queue.put((vectors, parents))
+                    except Exception as e:
+                        record_error(f"Error embedding {len(doc_chunks)} chunks: {str(e)}")
 
-                        successful_uploads += 1
-                        stored_data["vectorization_status"]["successful_docs"] = successful_uploads
-                        print(f"✅ [{successful_uploads}] Indexed: {url}")
+                if done:
+                    for _ in range(UPSERT_WORKERS):
+                        await upsert_queue.put(PIPELINE_DONE)
+                    return
 
-                    except Exception as e:
-                        error_msg = f"Error processing document {doc_i} from {base_url}: {str(e)}"
-                        print(f"❌ {error_msg}")
-                        stored_data["vectorization_status"]["errors"].append(error_msg)
-                        continue
+        async def upserter():
+            while True:
+                item = await upsert_queue.get()
+                if item is PIPELINE_DONE:
+                    return
 
-                stored_data["vectorization_status"]["processed_urls"] = i + 1
+                vectors, parents = item
+                try:
+                    upserted_ids, upsert_errors = await loop.run_in_executor(
+                        None, upsert_vectors, index, vectors
+                    )
+                    mark_indexed({parents[chunk_id] for chunk_id in upserted_ids})
+                    upserted = set(upserted_ids)
+                    add_to_local_index([vector for vector in vectors if vector["id"] in upserted])
+                    print(f"✅ [{len(indexed_docs)}] Upserted {len(upserted_ids)} chunks")
+                    for error_msg in upsert_errors:
+                        record_error(error_msg)
+                except Exception as e:
+                    record_error(f"Error upserting {len(vectors)} chunks: {str(e)}")
 
-            except Exception as e:
-                error_msg = f"Error crawling {base_url}: {str(e)}"
-                print(f"❌ {error_msg}")
-                stored_data["vectorization_status"]["errors"].append(error_msg)
-                stored_data["vectorization_status"]["processed_urls"] = i + 1
-                continue
+        async def crawl_all():
+            if deep:
+                await asyncio.gather(*[crawler(base_url) for base_url in url_list])
+            elif url_list:
+                await scraper(url_list)
+            await embed_queue.put(PIPELINE_DONE)
+
+        await asyncio.gather(
+            crawl_all(),
+            embedder(),
+            *[upserter() for _ in range(UPSERT_WORKERS)]
+        )
 
-        stored_data["vectorization_status"]["in_progress"] = False
-        stored_data["vectorization_status"]["completed"] = True
+        save_local_index()
+        invalidate_answer_cache()
+        update_status(in_progress=False, completed=True)
         
-        print(f"\n🎉 Finished! Total successful documents indexed: {successful_uploads}")
-        return successful_uploads
+        print(f"\n🎉 Finished! Total successful documents indexed: {len(indexed_docs)}")
+        return len(indexed_docs)
         
     except Exception as e:
-        stored_data["vectorization_status"]["in_progress"] = False
-        stored_data["vectorization_status"]["errors"].append(f"Fatal error: {str(e)}")
+        update_status(in_progress=False)
+        add_status_error(f"Fatal error: {str(e)}")
         print(f"❌ Fatal error in vectorization: {str(e)}")
         raise e
 
-def run_vectorization_in_thread(url_list: list[str], firecrawl_key: str):
+def run_vectorization_in_thread(url_list: list[str], firecrawl_key: str, deep: bool = True):
     """Run vectorization in a separate thread"""
     def run_async():
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         try:
-            loop.run_until_complete(process_urls_to_pinecone(url_list, firecrawl_key))
+            loop.run_until_complete(process_urls_to_pinecone(url_list, firecrawl_key, deep))
         except Exception as e:
             print(f"❌ Thread error: {str(e)}")
         finally:
@@ -265,26 +1030,73 @@ def run_vectorization_in_thread(url_list: list[str], firecrawl_key: str):
     thread.daemon = True
     thread.start()
 
-def search_and_answer(question, top_k=5):
+def get_firecrawl_app(api_key):
+    """Return the Firecrawl client, creating it only when the key changes"""
+    with firecrawl_client_lock:
+        if firecrawl_client["app"] is None or firecrawl_client["api_key"] != api_key:
+            firecrawl_client["app"] = AsyncFirecrawlApp(api_key=api_key)
+            firecrawl_client["api_key"] = api_key
+        return firecrawl_client["app"]
+
+def get_gemini_model(api_key):
+    """Return the Gemini model for an API key, creating it the first time the key is seen"""
+    with gemini_models_lock:
+        model = gemini_models.get(api_key)
+        if model is None:
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel('gemini-1.5-flash')
+            # GenerativeModel creates its client lazily from whatever key is
+            # configured at first use; create it now, while this key is active
+            model._client = genai_client.get_default_generative_client()
+            gemini_models[api_key] = model
+        return model
+
+@functools.lru_cache(maxsize=2048)
+def embed_query(question):
+    """Embed a normalized question; repeated questions skip the model entirely"""
+    model = load_ai_components()["model"]
+    return tuple(model.encode(question, normalize_embeddings=True).tolist())
+
+def search_and_answer(question, top_k=8, stream=False):
     """
-    Search the vector database and generate an AI answer using Gemini
+    Search the vector database and generate an AI answer using Gemini.
+    With stream=True the answer is a generator of text chunks.
     """
     try:
+        cache_key = answer_cache_key(question)
+        cached = get_cached_answer(cache_key)
+        if cached:
+            print(f"⚡ Cached answer for: '{question}'")
+            return cached
+        
         components = load_ai_components()
-        model = components["model"]
         index = components["index"]
         gemini_model = components["gemini_model"]
         
         print(f"🔍 Searching for: '{question}'")
         
         # 1. Search the vector database
-        query_embedding = model.encode(question, normalize_embeddings=True).tolist()
-        results = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
-        print(f"🔍 Results: {results}")
+        # BGE is uncased, so lowercasing only improves the cache hit rate
+        query_embedding = list(embed_query(question.strip().lower()))
+        cached = find_similar_answer(query_embedding)
+        if cached:
+            print(f"⚡ Cached answer for a similar question to: '{question}'")
+            return cached
+        # The local mirror answers most queries; Pinecone covers everything else
+        local_matches = query_local_index(query_embedding, top_k)
+        use_local = bool(local_matches) and local_matches[0]['score'] > 0.5
+        if use_local:
+            print("⚡ Using local vector index")
+            results = {'matches': local_matches}
+        else:
+            # Metadata is fetched afterwards, only for the matches we actually use
+            results = index.query(
+                vector=query_embedding,
+                top_k=top_k,
+                include_metadata=False,
+                include_values=False
+            )
+        print(f"🔍 Results: {results if not use_local else len(local_matches)}")
         
         if not results['matches']:
             return {
@@ -294,20 +1106,30 @@ def search_and_answer(question, top_k=5):
                 'method': 'vector_search'
             }
         
-        # 2. Collect relevant context
-        context_pieces = []
+        # 2. Collect relevant matches (top 3 reasonably relevant results)
+        good_ids = [match['id'] for match in results['matches'] if match['score'] > 0.5][:3]
+        if use_local:
+            metadata_by_id = {match['id']: match['metadata'] for match in local_matches}
+        elif good_ids:
+            fetched = index.fetch(ids=good_ids).vectors
+            metadata_by_id = {doc_id: vector.metadata or {} for doc_id, vector in fetched.items()}
+        else:
+            metadata_by_id = {}
+        relevant = []
         sources = []
         
-        for match in results['matches']:
-            if match['score'] > 0.5:  # Only reasonably relevant results
-                content = match['metadata'].get('full_content', '')
-                url = match['metadata'].get('url', 'Vector Database')
-                
-                if content and len(content) > 50:  # Skip very short content
-                    context_pieces.append(content)
-                    sources.append(url)
+        for doc_id in good_ids:
+            if doc_id not in metadata_by_id:
+                continue
+            metadata = metadata_by_id[doc_id]
+            snippet = metadata.get('snippet') or metadata.get('content', '')
+            url = metadata.get('url', 'Vector Database')
+            
+            if snippet and len(snippet) > 50:  # Skip very short content
+                relevant.append((doc_id, metadata))
+                sources.append(url)
         
-        if not context_pieces:
+        if not relevant:
             return {
                 'answer': "I found some results but they don't seem directly relevant to your question.",
                 'sources': [],
@@ -316,22 +1138,13 @@ def search_and_answer(question, top_k=5):
             }
         
         # 3. Combine context (limit to avoid token limits)
-        combined_context = '\n\n---\n\n'.join(context_pieces[:3])  # Top 3 results
-        if len(combined_context) > 4000:  # Limit context size
-            combined_context = combined_context[:4000] + "..."
+        context_pieces = [load_content(doc_id, metadata) for doc_id, metadata in relevant]
+        combined_context = trim_context(context_pieces, getattr(components["model"], "tokenizer", None))
         
         # 4. Generate AI answer using Gemini
         print("🤖 Generating AI answer with Gemini...")
         
-        prompt = f"""You are a helpful AI assistant with access to a vector database. 
-Use the provided context to answer questions accurately.
-
-Guidelines:
-- Be helpful, accurate, and concise
-- Only use information from the provided context
-- If the context doesn't contain enough information, say so
-- Include specific details when available
-- Be friendly and professional
+        prompt = f"""{SYSTEM_PROMPT_RAG}
 
 Question: {question}
 
@@ -340,17 +1153,31 @@ Context from vector database:
 
 Please provide a helpful answer based on the context above."""
         
-        response = gemini_model.generate_content(prompt)
-        ai_answer = response.text
-        
-        return {
-            'answer': ai_answer,
-            'sources': list(set(sources)),  # Remove duplicates
+        result = {
+            'sources': list(dict.fromkeys(sources)),  # Remove duplicates, keep ranking order
             'confidence': results['matches'][0]['score'],
             'raw_results': len(results['matches']),
             'method': 'vector_search'
         }
         
+        if stream:
+            response = gemini_model.generate_content(prompt, stream=True)
+            
+            def stream_and_cache():
+                # Only a fully streamed answer is cached
+                deltas = []
+                for chunk in response:
+                    deltas.append(chunk.text)
+                    yield chunk.text
+                cache_answer(cache_key, {**result, 'answer': ''.join(deltas)}, query_embedding)
+            
+            return {**result, 'answer': stream_and_cache()}
+        
+        response = gemini_model.generate_content(prompt)
+        result['answer'] = response.text
+        cache_answer(cache_key, result, query_embedding)
+        return dict(result)
+        
     except Exception as e:
         return {
             'answer': f"Sorry, I encountered an error with the vector search: {str(e)}",
@@ -360,6 +1187,40 @@ Please provide a helpful answer based on the context above."""
             'error': str(e)
         }
 
+def stream_chat_response(answer, payload):
+    """
+    Stream a chat answer as newline-delimited JSON: one line with the response
+    metadata, then one {"delta": ...} line per chunk of generated text
+    """
+    def generate():
+        yield app.json.dumps(payload) + "\n"
+        try:
+            for delta in ([answer] if isinstance(answer, str) else answer):
+                yield app.json.dumps({"delta": delta}) + "\n"
+        except Exception as e:
+            yield app.json.dumps({"error": f"Gemini API error: {str(e)}"}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def preload_ai_components():
+    """Load AI components in the background so the first request doesn't pay for it"""
+    def run_load():
+        try:
+            components = load_ai_components()
+            # The first encode pays for kernel selection and memory allocation;
+            # do it here rather than in the first chat request
+            components["model"].encode(["warmup"], normalize_embeddings=True, show_progress_bar=False)
+            print("✅ Embedding model warmed up")
+        except Exception as e:
+            print(f"⚠️ Background loading failed, components will load on first use: {e}")
+
+    thread = threading.Thread(target=run_load)
+    thread.daemon = True
+    thread.start()
+
+if AI_IMPORTS_AVAILABLE and PINECONE_API_KEY and os.getenv("EAGER_LOAD", "1") == "1":
+    preload_ai_components()
+
 # Routes
 @app.route('/', methods=['GET'])
 def root():
@@ -403,7 +1264,7 @@ def start_demo_mode():
         if not AI_IMPORTS_AVAILABLE:
             return jsonify({
                 "success": False,
-                "error": "AI libraries not installed. Please install: pip install sentence-transformers pinecone-client google-generativeai firecrawl-py"
+                "error": "AI libraries not installed. Please install: pip install sentence-transformers pinecone[grpc] google-generativeai firecrawl-py"
             }), 400
         
         if not GEMINI_API_KEY or not PINECONE_API_KEY:
@@ -454,7 +1315,7 @@ def crawl_and_vectorize():
         if not AI_IMPORTS_AVAILABLE:
             return jsonify({
                 "success": False,
-                "error": "AI libraries not installed. Please install: pip install sentence-transformers pinecone-client google-generativeai firecrawl-py"
+                "error": "AI libraries not installed. Please install: pip install sentence-transformers pinecone[grpc] google-generativeai firecrawl-py"
             }), 400
             
         firecrawl_key = stored_data['api_keys'].get('firecrawl')
@@ -464,24 +1325,23 @@ def crawl_and_vectorize():
                 "error": "Firecrawl API key not available"
             }), 400
         
-        if stored_data["vectorization_status"]["in_progress"]:
+        # Check and reset the status together so two requests can't both start a run
+        with status_lock:
+            already_running = stored_data["vectorization_status"]["in_progress"]
+            if not already_running:
+                stored_data["vectorization_status"] = new_vectorization_status(
+                    in_progress=True,
+                    total_urls=len(stored_data['urls'])
+                )
+        
+        if already_running:
             return jsonify({
                 "success": False,
                 "error": "Vectorization already in progress"
             }), 400
         
-        # Reset vectorization status
-        stored_data["vectorization_status"] = {
-            "in_progress": True,
-            "completed": False,
-            "total_urls": len(stored_data['urls']),
-            "processed_urls": 0,
-            "successful_docs": 0,
-            "errors": []
-        }
-        
         # Start vectorization in background thread
-        run_vectorization_in_thread(stored_data['urls'], firecrawl_key)
+        run_vectorization_in_thread(stored_data['urls'], firecrawl_key, stored_data['deep'])
         
         return jsonify({
             "success": True,
@@ -489,6 +1349,7 @@ def crawl_and_vectorize():
             "data": {
                 "total_urls": len(stored_data['urls']),
                 "urls": stored_data['urls'],
+                "deep": stored_data['deep'],
                 "index_name": INDEX_NAME
             }
         })
@@ -505,7 +1366,7 @@ def get_vectorization_status():
     """Get the current status of vectorization process"""
     return jsonify({
         "success": True,
-        "data": stored_data["vectorization_status"]
+        "data": status_snapshot()
     })
 
 @app.route('/api/store-config', methods=['POST'])
@@ -525,18 +1386,14 @@ def store_config():
         # Store URLs
         urls = data.get('urls', [])
         stored_data['urls'] = urls
+        # Crawl from the URLs unless the client asks for leaf-page scraping
+        stored_data['deep'] = bool(data.get('deep', True))
         
         # Reset demo mode and vectorization status if URLs are provided
         if urls:
             stored_data['demo_mode'] = False
-            stored_data["vectorization_status"] = {
-                "in_progress": False,
-                "completed": False,
-                "total_urls": 0,
-                "processed_urls": 0,
-                "successful_docs": 0,
-                "errors": []
-            }
+            with status_lock:
+                stored_data["vectorization_status"] = new_vectorization_status()
         
         print(f"📝 Stored config: {len(urls)} URLs, API keys: {list(stored_data['api_keys'].keys())}")
         
@@ -545,6 +1402,7 @@ def store_config():
             "message": "Configuration stored successfully",
             "data": {
                 "urls_count": len(urls),
+                "deep": stored_data['deep'],
                 "api_keys_received": list(api_keys.keys()),
                 "env_keys_used": {
                     "gemini": bool(GEMINI_API_KEY and not api_keys.get('gemini')),
@@ -563,10 +1421,14 @@ def store_config():
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    """Handle chat requests using Gemini API"""
+    """
+    Handle chat requests using Gemini API.
+    Send "stream": true to receive the answer as newline-delimited JSON chunks.
+    """
     try:
         data = request.get_json()
         user_message = data.get('message', '')
+        stream = bool(data.get('stream', False))
         
         if not user_message:
             return jsonify({
@@ -587,38 +1449,43 @@ def chat():
         
         if use_vector_search:
             try:
-                result = search_and_answer(user_message)
-                return jsonify({
+                result = search_and_answer(user_message, stream=stream)
+                payload = {
                     "success": True,
-                    "response": result['answer'],
                     "method": result['method'],
                     "sources": result.get('sources', []),
                     "confidence": result.get('confidence', 0),
                     "demo_mode": stored_data.get('demo_mode', False),
                     "vectorized": stored_data["vectorization_status"].get("completed", False)
-                })
+                }
+                if stream:
+                    return stream_chat_response(result['answer'], payload)
+                return jsonify({**payload, "response": result['answer']})
             except Exception as vector_error:
                 print(f"⚠️ Vector search failed, falling back to regular mode: {vector_error}")
         
         # Fallback to regular Gemini chat without context
         try:
-            genai.configure(api_key=gemini_key)
-            model = genai.GenerativeModel('gemini-1.5-flash')
+            model = get_gemini_model(gemini_key)
             
-            prompt = f"""You are a helpful AI assistant. Answer questions to the best of your ability.
+            prompt = f"""{SYSTEM_PROMPT_CHAT}
 
 User question: {user_message}"""
-            
-            response = model.generate_content(prompt)
-            ai_response = response.text
-            
-            return jsonify({
+            payload = {
                 "success": True,
-                "response": ai_response,
                 "method": "general_chat",
                 "demo_mode": False,
                 "vectorized": False
-            })
+            }
+            
+            if stream:
+                response = model.generate_content(prompt, stream=True)
+                return stream_chat_response((chunk.text for chunk in response), payload)
+            
+            response = model.generate_content(prompt)
+            ai_response = response.text
+            
+            return jsonify({**payload, "response": ai_response})
             
         except Exception as gemini_error:
             return jsonify({
@@ -644,7 +1511,7 @@ def get_status():
         "urls": stored_data['urls'],
         "demo_mode": stored_data.get('demo_mode', False),
         "ai_components_loaded": ai_components["loaded"],
-        "vectorization_status": stored_data["vectorization_status"],
+        "vectorization_status": status_snapshot(),
         "env_keys": {
             "gemini": bool(GEMINI_API_KEY),
             "pinecone": bool(PINECONE_API_KEY), 
@@ -657,7 +1524,7 @@ def get_status():
 def debug_status():
     """Debug endpoint to see exact vectorization status"""
     return jsonify({
-        "vectorization_status": stored_data["vectorization_status"],
+        "vectorization_status": status_snapshot(),
         "demo_mode": stored_data.get('demo_mode', False),
         "ai_components_loaded": ai_components["loaded"],
         "timestamp": datetime.now().isoformat(),
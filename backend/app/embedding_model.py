@@ -0,0 +1,87 @@
+"""Embedding model loading shared by backend_server.py, new2.py and ques.py"""
+import os
+import shutil
+from sentence_transformers import SentenceTransformer
+
+# ONNX Runtime with int8 weights is several times faster than PyTorch on CPU.
+# The hub only ships an fp32 ONNX graph for bge-small, so the int8 model is
+# exported and quantized once into ONNX_MODEL_DIR and reused from there.
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+# Quantization preset matching the CPU: arm64, avx2, avx512 or avx512_vnni
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx512_vnni")
+QUANTIZED_FILE = "onnx/model_int8.onnx"
+
+def export_quantized_model(model_name):
+    """Export the model to ONNX with int8 weights unless already done; returns its directory"""
+    path = os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+    if os.path.exists(os.path.join(path, QUANTIZED_FILE)):
+        return path
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    print(f"🔄 Exporting int8 ONNX model to {path} (first run only)...")
+    # Built in a scratch directory and renamed into place, so a crash or a
+    # second process never sees a half-written export
+    scratch_path = f"{path}.tmp{os.getpid()}"
+    try:
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save(scratch_path)
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, scratch_path, file_suffix="int8")
+        if not os.path.exists(os.path.join(scratch_path, QUANTIZED_FILE)):
+            raise FileNotFoundError(f"export did not produce {QUANTIZED_FILE}")
+        try:
+            os.rename(scratch_path, path)
+        except OSError:
+            # Another process finished the same export first
+            pass
+    finally:
+        shutil.rmtree(scratch_path, ignore_errors=True)
+    print(f"✅ int8 ONNX model exported ({ONNX_QUANTIZATION})")
+    return path
+
+def load_onnx_model(model_name, **model_kwargs):
+    """Load the model on ONNX Runtime, int8 export first; None if no ONNX model loads"""
+    sources = []
+    try:
+        sources.append((export_quantized_model(model_name), QUANTIZED_FILE))
+    except Exception as e:
+        print(f"⚠️ Could not export int8 ONNX model: {e}")
+    sources.append((model_name, "onnx/model.onnx"))
+
+    for path, file_name in sources:
+        try:
+            model = SentenceTransformer(
+                path,
+                backend="onnx",
+                model_kwargs={"file_name": file_name, **model_kwargs}
+            )
+            print(f"✅ Sentence transformer model loaded (ONNX Runtime, {file_name})")
+            return model
+        except Exception as e:
+            print(f"⚠️ Could not load ONNX model {file_name}: {e}")
+    return None
+
+def ensure_fast_tokenizer(model, model_name):
+    """Swap in the Rust-backed tokenizer if the model came with the slow Python one"""
+    if getattr(model.tokenizer, "is_fast", False):
+        return
+    print("⚠️ Slow tokenizer loaded; tokenizing would dominate encode latency")
+    try:
+        from transformers import AutoTokenizer
+        model.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        print("✅ Switched to the fast tokenizer")
+    except Exception as e:
+        print(f"⚠️ Could not load fast tokenizer: {e}")
+
+def load_model(model_name, max_seq_length=256):
+    """Load the embedding model for the standalone scripts, ready for the first query"""
+    model = load_onnx_model(model_name)
+    if model is None:
+        model = SentenceTransformer(model_name)
+        print("✅ Sentence transformer model loaded (PyTorch)")
+    ensure_fast_tokenizer(model, model_name)
+    # Retrieval works fine on the first 256 tokens, and attention cost grows with
+    # the square of the sequence length
+    model.max_seq_length = max_seq_length
+    # Run a small batch once so kernel selection happens now, not on the first real input
+    model.encode(["warmup"] * 8, normalize_embeddings=True)
+    return model
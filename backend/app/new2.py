@@ -1,26 +1,62 @@
 import asyncio
 from firecrawl import AsyncFirecrawlApp, ScrapeOptions
-from sentence_transformers import SentenceTransformer
 from pinecone import Pinecone, ServerlessSpec
 import os
 import dotenv
 import time
+import itertools
+import hashlib
+import json
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from embedding_model import load_model
+
+# gRPC data plane for Pinecone (pinecone[grpc]); falls back to REST when missing
+try:
+    from pinecone.grpc import PineconeGRPC, GRPCClientConfig
+    PINECONE_GRPC_AVAILABLE = True
+except ImportError:
+    PINECONE_GRPC_AVAILABLE = False
+
+# Local copy of the crawled vectors (faiss-cpu) that ques.py searches before Pinecone
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
 
 dotenv.load_dotenv()
 
 # === CONFIG ===
 FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = 'airport-index'
+# Same setting and default as backend_server.py; new2.py and ques.py must agree
+# on it for ques.py to find the local copy new2.py writes
+INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "airport-index")
 MODEL_NAME = 'BAAI/bge-small-en-v1.5'  # Can be swapped with any supported transformer model
+EMBED_MAX_CHARS = 1024      # ~256 tokens; text past this is cut before tokenizing
+# Full page text is kept on local disk; Pinecone only stores the url and a snippet
+CONTENT_STORE_DIR = os.getenv("CONTENT_STORE_DIR", "content_store")
+UPSERT_BATCH_SIZE = 100     # vectors per upsert request
+UPSERT_POOL_THREADS = 30    # upsert requests in flight at once
+DOCUMENT_CHUNK_SIZE = 1000  # vectors held in memory before flushing to Pinecone
+CRAWL_CONCURRENCY = 4       # Firecrawl crawls running at the same time
+# Read by ques.py: <LOCAL_INDEX_DIR>/<INDEX_NAME>.crawl.faiss plus .crawl.json (ids and
+# metadata). Keyed by index name, and kept apart from the server's <INDEX_NAME>.faiss
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+LOCAL_INDEX_PATH = os.path.join(LOCAL_INDEX_DIR, f"{INDEX_NAME}.crawl")
 
 # === INIT ===
 print("🔄 Loading embedding model...")
-model = SentenceTransformer(MODEL_NAME)
-print("✅ Model loaded!")
+model = load_model(MODEL_NAME)
 
 print("🔄 Setting up Pinecone...")
-pinecone = Pinecone(api_key=PINECONE_API_KEY)
+# The gRPC client sends vectors as protobuf instead of JSON; index management stays on REST
+if PINECONE_GRPC_AVAILABLE:
+    pinecone = PineconeGRPC(api_key=PINECONE_API_KEY)
+else:
+    pinecone = Pinecone(api_key=PINECONE_API_KEY)
 
 # Create index if not exists
 existing_indexes = [index.name for index in pinecone.list_indexes()]
@@ -38,28 +74,120 @@ if INDEX_NAME not in existing_indexes:
 else:
     print(f"✅ Index {INDEX_NAME} already exists!")
 
-index = pinecone.Index(INDEX_NAME)
+if PINECONE_GRPC_AVAILABLE:
+    index = pinecone.Index(INDEX_NAME, grpc_config=GRPCClientConfig(timeout=30))
+else:
+    index = pinecone.Index(INDEX_NAME, pool_threads=UPSERT_POOL_THREADS)
+print(f"✅ Pinecone connection established ({'gRPC' if PINECONE_GRPC_AVAILABLE else 'REST'})")
+
+def chunks(iterable, batch_size=UPSERT_BATCH_SIZE):
+    """Yield successive tuples of batch_size items from an iterable"""
+    it = iter(iterable)
+    chunk = tuple(itertools.islice(it, batch_size))
+    while chunk:
+        yield chunk
+        chunk = tuple(itertools.islice(it, batch_size))
+
+def save_content(doc_id, content):
+    """Write a document's full text to the content store"""
+    os.makedirs(CONTENT_STORE_DIR, exist_ok=True)
+    with open(os.path.join(CONTENT_STORE_DIR, f"{doc_id}.md"), "w", encoding="utf-8") as f:
+        f.write(content)
+
+# Vectors written to Pinecone during this run, mirrored locally at the end
+indexed_vectors = []
+indexed_vectors_lock = threading.Lock()
+
+def upsert_vectors(vectors):
+    """Upsert vectors in parallel batches and return how many were written"""
+    async_results = [
+        (batch, index.upsert(vectors=list(batch), async_req=True))
+        for batch in chunks(vectors)
+    ]
+    upserted = 0
+    for batch, async_result in async_results:
+        try:
+            # gRPC upserts return futures, REST upserts return thread pool results
+            if hasattr(async_result, "result"):
+                async_result.result()
+            else:
+                async_result.get()
+            upserted += len(batch)
+            with indexed_vectors_lock:
+                indexed_vectors.extend(batch)
+        except Exception as e:
+            print(f"❌ Error upserting batch of {len(batch)} vectors: {str(e)}")
+    return upserted
+
+def save_local_index(vectors):
+    """Merge vectors into the local FAISS index; re-crawled ids replace their old vector"""
+    if not FAISS_AVAILABLE or not vectors:
+        return
+    values = {}
+    metadata = {}
+    if os.path.exists(f"{LOCAL_INDEX_PATH}.faiss"):
+        try:
+            saved_index = faiss.read_index(f"{LOCAL_INDEX_PATH}.faiss")
+            with open(f"{LOCAL_INDEX_PATH}.json", encoding="utf-8") as f:
+                saved = json.load(f)
+            values.update(zip(saved["ids"], saved_index.reconstruct_n(0, saved_index.ntotal)))
+            metadata.update(saved["metadata"])
+        except Exception as e:
+            print(f"⚠️ Could not read existing local index, rebuilding it: {e}")
+            values.clear()
+            metadata.clear()
+    for vector in vectors:
+        values[vector["id"]] = vector["values"]
+        metadata[vector["id"]] = vector["metadata"]
+
+    # Embeddings are normalized, so inner product is cosine similarity
+    local_index = faiss.IndexFlatIP(384)
+    local_index.add(np.asarray(list(values.values()), dtype=np.float32))
+    os.makedirs(LOCAL_INDEX_DIR, exist_ok=True)
+    faiss.write_index(local_index, f"{LOCAL_INDEX_PATH}.faiss")
+    with open(f"{LOCAL_INDEX_PATH}.json", "w", encoding="utf-8") as f:
+        json.dump({"ids": list(values), "metadata": metadata}, f)
+    print(f"✅ Local vector index saved ({local_index.ntotal} vectors)")
+
+# Encoding is CPU bound; it runs on its own thread so crawls keep going meanwhile
+embed_pool = ThreadPoolExecutor(max_workers=1)
+
+def encode_documents(texts):
+    return model.encode(
+        texts,
+        batch_size=32,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=True
+    )
 
 # === MAIN EMBEDDING FUNCTION ===
 async def process_urls_to_pinecone(url_list: list[str]):
     app = AsyncFirecrawlApp(api_key=FIRECRAWL_API_KEY)
+    semaphore = asyncio.Semaphore(CRAWL_CONCURRENCY)
+    loop = asyncio.get_running_loop()
     successful_uploads = 0
+    pending_vectors = []
+    # Content hashes seen in this run, across all crawls
+    seen_hashes = set()
 
-    for base_url in url_list:
-        print(f"\n🕷️ Crawling: {base_url}")
+    async def crawl_one(base_url):
+        nonlocal successful_uploads, pending_vectors
         try:
-            result = await app.crawl_url(
-                url=base_url,
-                limit=70,
-                max_depth=70,
-                allow_backward_links=True,
-                scrape_options=ScrapeOptions(
-                    formats=["markdown"],
-                    only_main_content=True,
-                    parse_pdf=True,
-                    max_age=14400000
+            async with semaphore:
+                print(f"\n🕷️ Crawling: {base_url}")
+                result = await app.crawl_url(
+                    url=base_url,
+                    limit=70,
+                    max_depth=70,
+                    allow_backward_links=True,
+                    scrape_options=ScrapeOptions(
+                        formats=["markdown"],
+                        only_main_content=True,
+                        parse_pdf=True,
+                        max_age=14400000
+                    )
                 )
-            )
 
             # Parse documents
             if hasattr(result, 'data') and result.data:
@@ -71,6 +199,8 @@ async def process_urls_to_pinecone(url_list: list[str]):
 
             print(f"✅ Scraped {len(documents)} documents from {base_url}")
 
+            # Pass 1: extract and filter documents
+            docs_to_embed = []
             for i, doc in enumerate(documents):
                 try:
                     if hasattr(doc, 'metadata'):
@@ -88,31 +218,68 @@ async def process_urls_to_pinecone(url_list: list[str]):
                         print(f"⚠️ Skipping short content from: {url}")
                         continue
 
-                    print(f"🧠 Generating embedding for: {url}")
-                    embedding = model.encode(content, normalize_embeddings=True).tolist()
-
-                    doc_id = f"doc_{hash(url) % 100000}_{i}"
-
-                    index.upsert([{
-                        "id": doc_id,
-                        "values": embedding,
-                        "metadata": {
-                            "url": url,
-                            "content": content[:500],
-                            "full_content": content
-                        }
-                    }])
+                    # The same page often comes back under several URLs
+                    normalized = " ".join(content.lower().split())
+                    content_hash = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+                    if content_hash in seen_hashes:
+                        print(f"⚠️ Skipping duplicate content from: {url}")
+                        continue
+                    seen_hashes.add(content_hash)
 
-                    successful_uploads += 1
-                    print(f"✅ [{successful_uploads}] Indexed: {url}")
+                    docs_to_embed.append((i, url, content))
 
                 except Exception as e:
                     print(f"❌ Error processing document {i}: {str(e)}")
                     continue
 
+            if not docs_to_embed:
+                return
+
+            # Pass 2: embed every document of this crawl in one batched call
+            print(f"🧠 Generating embeddings for {len(docs_to_embed)} documents")
+            # Only the start is embedded; the content store keeps the whole page
+            embeddings = await loop.run_in_executor(
+                embed_pool,
+                encode_documents,
+                [content[:EMBED_MAX_CHARS] for _, _, content in docs_to_embed]
+            )
+
+            # Pass 3: queue vectors, uploading in bulk once enough have built up
+            for (i, url, content), embedding in zip(docs_to_embed, embeddings.tolist()):
+                # Stable across runs, so re-crawling a page overwrites its vector
+                doc_id = f"doc_{hashlib.blake2b(url.encode('utf-8'), digest_size=8).hexdigest()}"
+                save_content(doc_id, content)
+                pending_vectors.append({
+                    "id": doc_id,
+                    "values": embedding,
+                    # The full text is read back from the content store; the snippet
+                    # serves readers without it (the server's demo mode, ques.py fallback)
+                    "metadata": {
+                        "url": url,
+                        "snippet": content[:500]
+                    }
+                })
+
+            if len(pending_vectors) >= DOCUMENT_CHUNK_SIZE:
+                to_upsert, pending_vectors = pending_vectors, []
+                # Await first: `+=` would read the counter before other crawls update it
+                upserted = await loop.run_in_executor(None, upsert_vectors, to_upsert)
+                successful_uploads += upserted
+                print(f"✅ [{successful_uploads}] Indexed so far")
+
         except Exception as e:
             print(f"❌ Error crawling {base_url}: {str(e)}")
-            continue
+
+    # Crawls are network bound, so several run at once
+    await asyncio.gather(*[crawl_one(base_url) for base_url in url_list])
+
+    if pending_vectors:
+        successful_uploads += upsert_vectors(pending_vectors)
+
+    try:
+        save_local_index(indexed_vectors)
+    except Exception as e:
+        print(f"❌ Error saving local vector index: {str(e)}")
 
     print(f"\n🎉 Finished! Total successful documents indexed: {successful_uploads}")
 
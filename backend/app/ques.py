@@ -1,45 +1,170 @@
-from sentence_transformers import SentenceTransformer
 from pinecone import Pinecone
 import openai
 import os
 import dotenv
+import time
+import functools
+import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from embedding_model import load_model
+
+# gRPC data plane for Pinecone (pinecone[grpc]); falls back to REST when missing
+try:
+    from pinecone.grpc import PineconeGRPC, GRPCClientConfig
+    PINECONE_GRPC_AVAILABLE = True
+except ImportError:
+    PINECONE_GRPC_AVAILABLE = False
+
+# Local copy of the crawled vectors (faiss-cpu), searched before Pinecone
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
 
 dotenv.load_dotenv()
 
 # === CONFIG ===
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-INDEX_NAME = 'changiairport-index'
+# Read the index new2.py fills; its local FAISS copy is only found when the names match
+INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "airport-index")
 MODEL_NAME = 'BAAI/bge-small-en-v1.5'
+ANSWER_CACHE_TTL = 300  # seconds a generated answer is reused for the same question
+# Full page text written by new2.py; Pinecone metadata only holds the url and a snippet
+CONTENT_STORE_DIR = os.getenv("CONTENT_STORE_DIR", "content_store")
+# Local FAISS index written by new2.py for this Pinecone index (<INDEX_NAME>.crawl.faiss/.json)
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+LOCAL_INDEX_PATH = os.path.join(LOCAL_INDEX_DIR, f"{INDEX_NAME}.crawl")
+MAX_CONTEXT_CHARS = 4000
+CONTEXT_SEPARATOR = '\n\n---\n\n'
+# Above this score the top page is returned as is instead of asking the LLM
+EXTRACTIVE_ANSWER_SCORE = 0.9
+EXTRACTIVE_ANSWER_CHARS = 800
+
+SYSTEM_PROMPT = """You are a helpful assistant for Changi Airport in Singapore.
+Use the provided context to answer questions about the airport.
+
+Guidelines:
+- Be helpful, accurate, and concise
+- Only use information from the provided context
+- If the context doesn't contain enough information, say so
+- Include specific details like locations, timings, or procedures when available
+- Be friendly and professional"""
 
 # === INIT ===
-print("🔄 Loading components...")
-model = SentenceTransformer(MODEL_NAME)
-pinecone = Pinecone(api_key=PINECONE_API_KEY)
-index = pinecone.Index(INDEX_NAME)
-openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
-print("✅ All components loaded!")
-
-def search_and_answer(question, top_k=5):
+# Components are created on first use, so importing this module stays cheap
+@functools.lru_cache(maxsize=1)
+def get_model():
+    print("🔄 Loading embedding model...")
+    return load_model(MODEL_NAME)
+
+@functools.lru_cache(maxsize=1)
+def get_index():
+    # Queries go over gRPC (protobuf) when pinecone[grpc] is installed
+    if PINECONE_GRPC_AVAILABLE:
+        return PineconeGRPC(api_key=PINECONE_API_KEY).Index(
+            INDEX_NAME,
+            grpc_config=GRPCClientConfig(timeout=30)
+        )
+    return Pinecone(api_key=PINECONE_API_KEY).Index(INDEX_NAME)
+
+@functools.lru_cache(maxsize=1)
+def get_openai():
+    return openai.OpenAI(api_key=OPENAI_API_KEY)
+
+@functools.lru_cache(maxsize=1)
+def get_local_index():
+    """Load the local FAISS index written by new2.py, or None if there isn't one"""
+    if not FAISS_AVAILABLE or not os.path.exists(f"{LOCAL_INDEX_PATH}.faiss"):
+        return None
+    try:
+        local_index = faiss.read_index(f"{LOCAL_INDEX_PATH}.faiss")
+        with open(f"{LOCAL_INDEX_PATH}.json", encoding="utf-8") as f:
+            saved = json.load(f)
+        print(f"✅ Local vector index loaded ({local_index.ntotal} vectors)")
+        return local_index, saved["ids"], saved["metadata"]
+    except Exception as e:
+        print(f"⚠️ Could not load local vector index: {e}")
+        return None
+
+def query_local_index(query_embedding, top_k):
+    """Search the local index, returning Pinecone-style matches with metadata"""
+    local = get_local_index()
+    if local is None:
+        return []
+    local_index, ids, metadata = local
+    scores, labels = local_index.search(np.asarray([query_embedding], dtype=np.float32), top_k)
+    return [
+        {'id': ids[label], 'score': float(score), 'metadata': metadata[ids[label]]}
+        for score, label in zip(scores[0], labels[0])
+        if label != -1
+    ]
+
+# (question, top_k) -> (expiry time, response)
+answer_cache = {}
+
+content_reader = ThreadPoolExecutor(max_workers=5)
+
+def load_content(match):
+    """Read a match's full text, falling back to what is stored in Pinecone"""
+    try:
+        with open(os.path.join(CONTENT_STORE_DIR, f"{match['id']}.md"), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        # Vectors indexed before the content store existed carry the text in metadata
+        metadata = match['metadata']
+        return metadata.get('full_content') or metadata.get('snippet') or metadata.get('content', '')
+
+def cache_answer(cache_key, result):
+    # Drop expired answers while we're here so the cache can't grow forever
+    now = time.monotonic()
+    for key in [key for key, (expiry, _) in answer_cache.items() if expiry <= now]:
+        del answer_cache[key]
+    answer_cache[cache_key] = (now + ANSWER_CACHE_TTL, result)
+
+@functools.lru_cache(maxsize=1024)
+def embed_query(question):
+    """Embed a question; repeated questions skip the model entirely"""
+    return tuple(get_model().encode(question, normalize_embeddings=True).tolist())
+
+def search_and_answer(question, top_k=3, stream=False, allow_extractive=True):
     """
     Search the database and generate an AI answer
     
     Args:
         question (str): User's question
         top_k (int): Number of search results to consider
+        stream (bool): Return the answer as a generator of text chunks
+        allow_extractive (bool): Answer from the top match directly when it is
+            a near-certain hit, skipping the OpenAI call
     
     Returns:
         dict: Contains the AI answer and sources
     """
+    cache_key = (question, top_k)
+    cached = answer_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        print(f"⚡ Cached answer for: '{question}'")
+        return cached[1]
+    
     print(f"🔍 Searching for: '{question}'")
     
     # 1. Search the vector database
-    query_embedding = model.encode(question, normalize_embeddings=True).tolist()
-    results = index.query(
-        vector=query_embedding,
-        top_k=top_k,
-        include_metadata=True
-    )
+    query_embedding = list(embed_query(question))
+    # The local copy answers without a network round trip; Pinecone covers misses
+    local_matches = query_local_index(query_embedding, top_k)
+    if local_matches and local_matches[0]['score'] > 0.5:
+        print("⚡ Using local vector index")
+        results = {'matches': local_matches}
+    else:
+        results = get_index().query(
+            vector=query_embedding,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=False
+        )
     
     if not results['matches']:
         return {
@@ -51,15 +176,17 @@ def search_and_answer(question, top_k=5):
     # 2. Collect relevant context
     context_pieces = []
     sources = []
+    scores = []
     
-    for match in results['matches']:
-        if match['score'] > 0.5:  # Only reasonably relevant results
-            content = match['metadata'].get('full_content', '')
-            url = match['metadata'].get('url', 'Unknown')
-            
-            if content and len(content) > 50:  # Skip very short content
-                context_pieces.append(content)
-                sources.append(url)
+    # Only the top 3 reasonably relevant results; their full text is read in parallel
+    relevant = [match for match in results['matches'] if match['score'] > 0.5][:3]
+    for match, content in zip(relevant, content_reader.map(load_content, relevant)):
+        url = match['metadata'].get('url', 'Unknown')
+        
+        if content and len(content) > 50:  # Skip very short content
+            context_pieces.append(content)
+            sources.append(url)
+            scores.append(match['score'])
     
     if not context_pieces:
         return {
@@ -68,25 +195,39 @@ def search_and_answer(question, top_k=5):
             'confidence': 0
         }
     
-    # 3. Combine context (limit to avoid token limits)
-    combined_context = '\n\n---\n\n'.join(context_pieces[:3])  # Top 3 results
-    if len(combined_context) > 4000:  # Limit context size
-        combined_context = combined_context[:4000] + "..."
+    # A near-certain hit is usually just paraphrased by the LLM; its first
+    # paragraph answers the question without the OpenAI round trip. The score
+    # checked is that of the page returned, as short pages are skipped above.
+    top_score = results['matches'][0]['score']
+    if allow_extractive and scores[0] > EXTRACTIVE_ANSWER_SCORE:
+        print("⚡ High-confidence match, answering from the page directly")
+        return {
+            'answer': context_pieces[0].split("\n\n", 1)[0][:EXTRACTIVE_ANSWER_CHARS],
+            'sources': [sources[0]],
+            'confidence': scores[0],
+            'raw_results': len(results['matches'])
+        }
+    
+    # 3. Combine the results, stopping at the context size limit
+    # instead of joining everything and slicing afterwards
+    kept = []
+    remaining = MAX_CONTEXT_CHARS
+    for piece in context_pieces:
+        if kept:
+            remaining -= len(CONTEXT_SEPARATOR)
+            if remaining <= 0:
+                kept[-1] += "..."
+                break
+        if len(piece) > remaining:
+            kept.append(piece[:remaining] + "...")
+            break
+        kept.append(piece)
+        remaining -= len(piece)
+    combined_context = CONTEXT_SEPARATOR.join(kept)
     
     # 4. Generate AI answer using OpenAI
     print("🤖 Generating AI answer...")
     
-    system_prompt = """You are a helpful assistant for Changi Airport in Singapore. 
-    Use the provided context to answer questions about the airport.
-    
-    Guidelines:
-    - Be helpful, accurate, and concise
-    - Only use information from the provided context
-    - If the context doesn't contain enough information, say so
-    - Include specific details like locations, timings, or procedures when available
-    - Be friendly and professional
-    """
-    
     user_prompt = f"""Question: {question}
 
 Context from Changi Airport website:
@@ -95,25 +236,40 @@ Context from Changi Airport website:
 Please provide a helpful answer based on the context above."""
     
     try:
-        response = openai_client.chat.completions.create(
+        response = get_openai().chat.completions.create(
             model="gpt-4o-mini",  # or "gpt-3.5-turbo" for cheaper option
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt}
             ],
             max_tokens=500,
-            temperature=0.3  # Lower temperature for more factual responses
+            temperature=0.3,  # Lower temperature for more factual responses
+            stream=stream
         )
         
-        ai_answer = response.choices[0].message.content
-        
-        return {
-            'answer': ai_answer,
-            'sources': list(set(sources)),  # Remove duplicates
-            'confidence': results['matches'][0]['score'],
+        result = {
+            'sources': list(dict.fromkeys(sources)),  # Remove duplicates, keep ranking order
+            'confidence': top_score,
             'raw_results': len(results['matches'])
         }
         
+        if stream:
+            def stream_and_cache():
+                # Only a fully streamed answer is cached
+                deltas = []
+                for chunk in response:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        deltas.append(delta)
+                        yield delta
+                cache_answer(cache_key, {**result, 'answer': ''.join(deltas)})
+            
+            return {**result, 'answer': stream_and_cache()}
+        
+        result['answer'] = response.choices[0].message.content
+        cache_answer(cache_key, result)
+        return result
+        
     except Exception as e:
         return {
             'answer': f"Sorry, I encountered an error generating the answer: {str(e)}",
@@ -128,7 +284,16 @@ def print_ai_response(response):
     print("="*80)
     
     print(f"\n📝 Answer:")
-    print(response['answer'])
+    if isinstance(response['answer'], str):
+        print(response['answer'])
+    else:
+        # Streamed answer: print tokens as they arrive
+        deltas = []
+        for delta in response['answer']:
+            deltas.append(delta)
+            print(delta, end="", flush=True)
+        print()
+        response['answer'] = ''.join(deltas)
     
     if response['sources']:
         print(f"\n🔗 Sources ({len(response['sources'])} found):")
@@ -176,7 +341,7 @@ def interactive_ai_assistant():
         
         try:
             print("🔄 Processing your question...")
-            response = search_and_answer(user_input)
+            response = search_and_answer(user_input, stream=True)
             print_ai_response(response)
             
         except Exception as e:
@@ -205,6 +370,10 @@ def test_ai_assistant():
             input("\nPress Enter to continue to next test...")
 
 if __name__ == "__main__":
+    # Load and warm up the model before the first question is typed
+    get_model()
+    get_local_index()
+    
     # Choose what to run
     mode = input("Choose mode:\n1. Interactive Assistant\n2. Run Tests\nEnter choice (1 or 2): ").strip()
     
@@ -0,0 +1,17 @@
+# Gunicorn configuration for the Flask backend
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# API keys, URLs and vectorization status are kept in process memory, so
+# run a single worker and serve concurrent requests from a thread pool.
+# Chat requests spend most of their time waiting on Pinecone and Gemini.
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+timeout = 120
+
+# preload_app stays off: ONNX Runtime and OpenMP thread pools created in the
+# master do not survive fork. The app starts loading its AI components in a
+# background thread as soon as the worker imports it.
+preload_app = False
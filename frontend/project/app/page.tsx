@@ -3,6 +3,7 @@
 import { useState, useEffect, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
+import { Checkbox } from '@/components/ui/checkbox';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Progress } from '@/components/ui/progress';
 import { Plus, Send, Globe, Key, MessageCircle, Trash2, Loader2, Database } from 'lucide-react';
@@ -57,6 +58,8 @@ export default function ChatbotApp() {
   });
   const [urls, setUrls] = useState<string[]>([]);
   const [newUrl, setNewUrl] = useState('');
+  // Crawl pages linked from each URL; when off, only the listed pages are scraped
+  const [deepCrawl, setDeepCrawl] = useState(true);
   const [messages, setMessages] = useState<Message[]>([]);
   const [currentMessage, setCurrentMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
@@ -385,7 +388,8 @@ I'm ready to help you with information from the vector database!`,
         },
         body: JSON.stringify({
           apiKeys: apiKeys,
-          urls: urls
+          urls: urls,
+          deep: deepCrawl
         })
       });
 
@@ -702,6 +706,17 @@ I'm ready to help you with information from the vector database!`,
                   </div>
                 )}
                 
+                <div className="flex items-center gap-2">
+                  <Checkbox
+                    id="deep-crawl"
+                    checked={deepCrawl}
+                    onCheckedChange={(checked) => setDeepCrawl(checked === true)}
+                  />
+                  <label htmlFor="deep-crawl" className="text-sm text-gray-700">
+                    Also crawl pages linked from these URLs
+                  </label>
+                </div>
+                
                 <div className="flex gap-2">
                   <Button 
                     onClick={handleBackToWelcome}